@@ -1,5 +1,32 @@
 import re
-from typing import List, Dict
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Tuple
+
+_SECTION_RE = re.compile(r'^(#{2,6})\s+(.*)', re.MULTILINE)
+_TITLE_RE = re.compile(r'^##\s+(.*)', re.MULTILINE)
+# Block cần giữ nguyên: code block, bảng, list. Mỗi loại một regex neo theo dòng
+# ([^\n]* thay cho .* + DOTALL) để tránh backtracking lồng nhau trên input xấu.
+_CODE_FENCE_RE = re.compile(r'```[\s\S]*?```')
+_TABLE_RE = re.compile(r'^\|[^\n]*\|(?:\n\|[^\n]*\|)+', re.MULTILINE)
+_LIST_RE = re.compile(r'^[-*][ \t][^\n]*(?:\n[-*][ \t][^\n]*)*', re.MULTILINE)
+
+
+@dataclass
+class ChunkBatch:
+    """Các chunk của một tài liệu, lưu dạng mảng song song (doc_title chỉ lưu một lần)."""
+    doc_title: str
+    sections: List[str] = field(default_factory=list)
+    chunk_ids: List[int] = field(default_factory=list)
+    contents: List[str] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.contents)
+
+    def append(self, section: str, content: str) -> None:
+        """Thêm một chunk, chunk_id tăng dần từ 1."""
+        self.sections.append(section)
+        self.chunk_ids.append(len(self.contents) + 1)
+        self.contents.append(content)
 
 
 def split_paragraphs(text: str) -> List[str]:
@@ -36,88 +63,84 @@ def split_with_overlap(text: str, max_tokens: int = 200, overlap: int = 50) -> L
     return chunks
 
 
-def parse_markdown_sections(markdown: str) -> List[Dict]:
-    """Parse Markdown thành danh sách section {heading, level, start, end, content}."""
-    pattern = re.compile(r'^(#{2,6})\s+(.*)', re.MULTILINE)
-    matches = list(pattern.finditer(markdown))
+def split_blocks(content: str) -> Iterator[Tuple[str, str]]:
+    """
+    Tách content thành các đoạn ("text", ...) xen kẽ với block cần giữ nguyên ("block", ...):
+    code block, bảng, list. Đoạn text rỗng/chỉ có khoảng trắng bị bỏ qua.
+    """
+    spans = []
+    for pattern in (_CODE_FENCE_RE, _TABLE_RE, _LIST_RE):
+        spans.extend(m.span() for m in pattern.finditer(content))
+    spans.sort()
+
+    pos = 0
+    for start, end in spans:
+        if start < pos:
+            # nằm trong block đã lấy (vd: dòng '- ...' bên trong code block)
+            continue
+        pre = content[pos:start]
+        if pre.strip():
+            yield "text", pre
+        yield "block", content[start:end]
+        pos = end
+    tail = content[pos:]
+    if tail.strip():
+        yield "text", tail
+
+
+def parse_markdown_sections(markdown: str, min_tokens: int = 0) -> List[Dict]:
+    """
+    Parse Markdown thành danh sách section {heading, level, content}.
+    Section có nội dung ngắn hơn min_tokens được gộp dần vào section kế tiếp (trong cùng một lượt duyệt).
+    """
+    matches = list(_SECTION_RE.finditer(markdown))
 
     sections = []
+    headings, contents, token_count = [], [], 0
     for i, m in enumerate(matches):
         start = m.end()
         end = matches[i+1].start() if i+1 < len(matches) else len(markdown)
-        heading = m.group(2).strip()
-        level = len(m.group(1))
         content = markdown[start:end].strip()
+        headings.append(m.group(2).strip())
+        contents.append(content)
+        token_count += len(content.split())
+        if token_count < min_tokens and i+1 < len(matches):
+            # chưa đủ dài -> gộp với section kế tiếp
+            continue
         sections.append({
-            "heading": heading,
-            "level": level,
-            "content": content
+            "heading": " + ".join(headings),
+            "level": len(m.group(1)),
+            "content": "\n\n".join(contents)
         })
+        headings, contents, token_count = [], [], 0
     return sections
 
 
-def merge_sections_below_min_tokens(sections: List[Dict], min_tokens: int) -> List[Dict]:
-    """Merge các section có nội dung quá ngắn với section kế tiếp hoặc trước đó."""
-    merged = []
-    i = 0
-    while i < len(sections):
-        sec = sections[i]
-        token_count = len(sec["content"].split())
-        if token_count < min_tokens and i+1 < len(sections):
-            # merge với section kế tiếp
-            sections[i+1]["content"] = sec["content"] + "\n\n" + sections[i+1]["content"]
-            sections[i+1]["heading"] = sec["heading"] + " + " + sections[i+1]["heading"]
-        else:
-            merged.append(sec)
-        i += 1
-    return merged
-
-
-def chunk_markdown(markdown: str, max_tokens: int = 200, overlap: int = 50, min_tokens: int = 50) -> List[Dict]:
+def chunk_markdown(markdown: str, max_tokens: int = 200, overlap: int = 50, min_tokens: int = 50) -> ChunkBatch:
     """Chunk Markdown với overlap + merge section ngắn + metadata."""
     # Lấy tiêu đề chính (heading đầu tiên)
-    title_match = re.search(r'^##\s+(.*)', markdown, re.MULTILINE)
+    title_match = _TITLE_RE.search(markdown)
     doc_title = title_match.group(1).strip() if title_match else "Untitled Document"
 
     # Parse và merge short sections
-    sections = parse_markdown_sections(markdown)
-    sections = merge_sections_below_min_tokens(sections, min_tokens=min_tokens)
+    sections = parse_markdown_sections(markdown, min_tokens=min_tokens)
 
-    all_chunks = []
-    chunk_id = 1
+    chunks = ChunkBatch(doc_title=doc_title)
 
     for sec in sections:
         heading = sec["heading"]
         content = sec["content"]
 
         # Preserve bảng, code block, list
-        blocks = re.split(r'(```.*?```|\|.*\|(?:\n\|.*\|)+|\n[-*]\s.*(?:\n[-*]\s.*)*)',
-                          content, flags=re.DOTALL)
-
-        for block in blocks:
+        for kind, block in split_blocks(content):
             block = block.strip()
-            if not block:
-                continue
 
-            if block.startswith("```") or block.startswith("|") or block.startswith("-") or block.startswith("*"):
+            if kind == "block":
                 # preserve nguyên block
-                all_chunks.append({
-                    "doc_title": doc_title,
-                    "section": heading,
-                    "chunk_id": chunk_id,
-                    "content": block
-                })
-                chunk_id += 1
+                chunks.append(heading, block)
             else:
                 # recursive split với overlap
-                sub_chunks = split_with_overlap(block, max_tokens=max_tokens, overlap=overlap)
-                for sub in sub_chunks:
-                    all_chunks.append({
-                        "doc_title": doc_title,
-                        "section": heading,
-                        "chunk_id": chunk_id,
-                        "content": sub
-                    })
-                    chunk_id += 1
-
-    return all_chunks
+                for sub in split_with_overlap(block, max_tokens=max_tokens, overlap=overlap):
+                    chunks.append(heading, sub)
+
+    return chunks
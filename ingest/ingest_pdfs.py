@@ -1,36 +1,105 @@
-from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional
 import logging
+import os
+import re
+import unicodedata
+import pypdfium2 as pdfium
 from chunking.chunking import chunk_markdown
 from docling.datamodel.accelerator_options import AcceleratorDevice, AcceleratorOptions
 from docling.datamodel.base_models import InputFormat
 from docling.datamodel.pipeline_options import PdfPipelineOptions
 from docling.document_converter import DocumentConverter, PdfFormatOption
 from text.text_normalization import normalize_markdown_pdfs
-from vectorstore.chroma_store import add_chunks_to_vectorstore
+from vectorstore.chroma_store import ChunkWriter
 
 _log = logging.getLogger(__name__)
 
+# Docling threads per process; lowered in pool workers so they don't oversubscribe the CPUs
+_pdf_num_threads = 4
+# Leading pages that must have a text layer before the probe trusts the PDF's text
+_PROBE_PAGES = 2
+_MIN_CHARS_PER_PAGE = 200
+# Table captions ("Bảng 1.", "Table 2", "Tab. 3"); without one the table structure model is skipped
+_TABLE_CAPTION_RE = re.compile(r"^\s*(?:Bảng|Table|Tab\.)\s*\d+", re.MULTILINE | re.IGNORECASE)
+# Signs of a broken glyph -> Unicode mapping besides '/uniXXXX' escapes (U+FFFD,
+# private use, control chars); captions can't be trusted on such pages, so tables stay on
+_BAD_GLYPH_RE = re.compile("[\ufffd\ue000-\uf8ff\x00-\x08\x0b\x0c\x0e-\x1f]")
+_MAX_BAD_GLYPHS_PER_PAGE = 5
+
+
+def _init_pdf_worker(num_threads: int) -> None:
+	"""Process pool initializer: set the Docling thread count for this worker."""
+	global _pdf_num_threads
+	_pdf_num_threads = num_threads
+
+
+@lru_cache(maxsize=None)
+def _get_pdf_converter(do_table_structure: bool = True) -> DocumentConverter:
+	"""Build a Docling PDF converter for the given pipeline options on first use and reuse it (per process)."""
+	pipeline_options = PdfPipelineOptions()
+	pipeline_options.do_ocr = False
+	pipeline_options.do_table_structure = do_table_structure
+	if do_table_structure:
+		pipeline_options.table_structure_options.do_cell_matching = True
+	pipeline_options.accelerator_options = AcceleratorOptions(
+		num_threads=_pdf_num_threads, device=AcceleratorDevice.AUTO
+	)
+
+	return DocumentConverter(
+		format_options={
+			InputFormat.PDF: PdfFormatOption(
+				pipeline_options=pipeline_options
+			)
+		}
+	)
+
+
+def _needs_table_structure(file_path: str) -> bool:
+	"""
+	Cheap pdfium pass over the PDF's text layer to decide whether Docling's table
+	structure model is worth running. Only text PDFs with a clean text layer and no
+	table caption skip it; anything unclear (no text layer, broken glyph mapping,
+	any pdfium error) keeps the full pipeline.
+
+	Without table structure Docling emits table regions with no cells and no text,
+	so a table whose caption is not a line-start "Bảng N" / "Table N" / "Tab. N"
+	in the text layer loses its content, not just its layout.
+	"""
+	pdf = None
+	try:
+		pdf = pdfium.PdfDocument(file_path)
+		for index in range(len(pdf)):
+			page = pdf[index]
+			textpage = page.get_textpage()
+			try:
+				if index < _PROBE_PAGES and textpage.count_chars() < _MIN_CHARS_PER_PAGE:
+					return True
+				text = textpage.get_text_range()
+				if "/uni" in text or len(_BAD_GLYPH_RE.findall(text)) > _MAX_BAD_GLYPHS_PER_PAGE:
+					return True
+				# NFC so decomposed Vietnamese ('Ba\u0309ng') still matches the caption regex
+				if _TABLE_CAPTION_RE.search(unicodedata.normalize("NFC", text)):
+					return True
+			finally:
+				textpage.close()
+				page.close()
+		return False
+	except Exception as e:
+		_log.warning(f"Could not probe {file_path}: {e}")
+		return True
+	finally:
+		if pdf is not None:
+			pdf.close()
+
 
 def convert_pdf_to_markdown(file_path: str):
 	"""
 	Convert a PDF file to Markdown text using Docling.
 	"""
 	try:
-		pipeline_options = PdfPipelineOptions()
-		pipeline_options.do_ocr = False
-		pipeline_options.do_table_structure = True
-		pipeline_options.table_structure_options.do_cell_matching = True
-		pipeline_options.accelerator_options = AcceleratorOptions(
-			num_threads=4, device=AcceleratorDevice.AUTO
-		)
-
-		converter = DocumentConverter(
-			format_options={
-				InputFormat.PDF: PdfFormatOption(
-					pipeline_options=pipeline_options
-				)
-			}
-		)
+		converter = _get_pdf_converter(_needs_table_structure(file_path))
 
 		# Run conversion
 		doc = converter.convert(file_path).document
@@ -42,19 +111,46 @@ def convert_pdf_to_markdown(file_path: str):
 		return None
 
 
-def ingest_pdfs(pdf_dir: str) -> None:
+def _convert_and_chunk(file_path: str):
+	"""Convert, normalize and chunk a single PDF. Runs inside a worker process."""
+	markdown = convert_pdf_to_markdown(file_path)
+	if not markdown:
+		return None
+	clean_markdown = normalize_markdown_pdfs(markdown)
+	return chunk_markdown(clean_markdown, max_tokens=500, overlap=100, min_tokens=200)
+
+
+def ingest_pdfs(pdf_dir: str, max_workers: Optional[int] = None) -> None:
 	"""Process all PDF files in a directory and extract Markdown content."""
-	pdf_files = list(Path(pdf_dir).glob("*.pdf"))
+	try:
+		with os.scandir(pdf_dir) as entries:
+			pdf_files = [
+				os.path.join(pdf_dir, entry.name)
+				for entry in entries
+				if entry.name.lower().endswith(".pdf") and entry.is_file()
+			]
+	except OSError as e:
+		_log.error(f"Cannot read PDF directory {pdf_dir}: {e}")
+		return
 	if not pdf_files:
 		_log.warning(f"No PDF files found in directory {pdf_dir}.")
 		return
 
-	for pdf_path in pdf_files:
-		markdown = convert_pdf_to_markdown(str(pdf_path))
-		if markdown:
-			clean_markdown = normalize_markdown_pdfs(markdown)
-			chunks = chunk_markdown(clean_markdown, max_tokens=500, overlap=100, min_tokens=200)
-			add_chunks_to_vectorstore(chunks)
-		else:
-			_log.error(f"Failed to extract content from {pdf_path}")
+	cpu_count = os.cpu_count() or 2
+	if max_workers is None:
+		max_workers = max(1, cpu_count // 2)
+	num_threads = max(1, cpu_count // max_workers)
 
+	# Docling conversion is CPU-bound and independent per file, so it runs in a
+	# process pool (cores split between workers); only the resulting chunks come
+	# back, and the vector store writes stay on the main process, buffered across
+	# PDFs into large batches by ChunkWriter.
+	with ProcessPoolExecutor(
+		max_workers=max_workers, initializer=_init_pdf_worker, initargs=(num_threads,)
+	) as executor, ChunkWriter() as writer:
+		results = executor.map(_convert_and_chunk, pdf_files)
+		for pdf_path, chunks in zip(pdf_files, results):
+			if chunks is None:
+				_log.error(f"Failed to extract content from {pdf_path}")
+				continue
+			writer.add(chunks)
@@ -1,25 +1,99 @@
-import os
 import logging
+import re
 import requests
-from tempfile import NamedTemporaryFile
-from bs4 import BeautifulSoup
-from docling.document_converter import DocumentConverter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Optional
+from bs4 import BeautifulSoup, SoupStrainer
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry, make_headers
 
 from chunking.chunking import chunk_markdown
 from text.text_normalization import normalize_markdown_urls
-from vectorstore.chroma_store import add_chunks_to_vectorstore
+from vectorstore.chroma_store import ChunkWriter
 
 
 _log = logging.getLogger(__name__)
 
-# Dynamic configuration for different websites
+# Number of URLs fetched and extracted concurrently
+FETCH_WORKERS = 16
+# URLs submitted but not yet handled; the URL file is read only as results complete
+MAX_IN_FLIGHT = 2 * FETCH_WORKERS
+
+# Retry transient server errors with backoff (0.3s, 0.6s, 1.2s)
+FETCH_RETRY = Retry(total=3, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504])
+USER_AGENT = "Mozilla/5.0 (compatible; rag-chatbot-ingest)"
+# Pages are streamed in READ_CHUNK_SIZE pieces and dropped past MAX_PAGE_BYTES (decoded)
+MAX_PAGE_BYTES = 5 * 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+_HEADING_TAGS = ["h1", "h2", "h3", "h4", "h5", "h6"]
+# Tags that end a paragraph / a line when the extracted HTML is flattened to text
+_PARAGRAPH_TAGS = ["p", "div", "blockquote"]
+_LINE_TAGS = ["br"]
+_EXTRA_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+def _inline_text(element) -> str:
+	"""Text of an element on one line (whitespace, including newlines, collapsed)."""
+	return " ".join(element.get_text(" ").split())
+
+
+def _heading(element, level: int = 2) -> str:
+	return f"{'#' * level} {_inline_text(element)}"
+
+
+def _list_block(element) -> str:
+	items = element.find_all("li", recursive=False)
+	return "\n".join(f"- {_inline_text(item)}" for item in items)
+
+
+def _table_block(element) -> str:
+	rows = []
+	for row in element.find_all("tr"):
+		cells = [_inline_text(cell) for cell in row.find_all(["td", "th"], recursive=False)]
+		if not cells:
+			continue
+		rows.append("| " + " | ".join(cells) + " |")
+		if len(rows) == 1:
+			rows.append("|" + " --- |" * len(cells))
+	return "\n".join(rows)
+
+
+def _to_markdown(element) -> str:
+	"""
+	Flatten an extracted element to Markdown text: lists become '- ' lines and
+	tables '| cell | cell |' rows (kept whole by the chunker's split_blocks),
+	inner headings become '##'+ lines (the chunker splits sections on them),
+	block tags end a paragraph or a line and inline markup is dropped.
+	"""
+	# Innermost lists/tables first, so an outer one sees inner ones as plain text
+	for block in reversed(element.find_all(["ul", "ol", "table"])):
+		markdown = _list_block(block) if block.name != "table" else _table_block(block)
+		block.replace_with(f"\n\n{markdown}\n\n")
+	for heading in element.find_all(_HEADING_TAGS):
+		heading.replace_with(f"\n\n{_heading(heading, max(2, int(heading.name[1])))}\n\n")
+	for tag in element.find_all(_PARAGRAPH_TAGS):
+		tag.insert_before("\n\n")
+		tag.append("\n\n")
+	for tag in element.find_all(_LINE_TAGS):
+		tag.append("\n")
+	text = "\n".join(line.strip() for line in element.get_text().splitlines())
+	return _EXTRA_BLANK_LINES_RE.sub("\n\n", text).strip()
+
+
+def _join_markdown(*parts: str) -> str:
+	return "\n\n".join(part for part in parts if part)
+
+
+# Dynamic configuration for different websites; "combine" renders the found tags as Markdown
 SITE_EXTRACT_RULES = {
 	"fcri.com.vn": {
 		"selectors": {
 			"content_right": ("div", {"class": "content-right-sp"}),
 			"content_main": ("div", {"class": "content-main-sp"})
 		},
-		"combine": lambda texts: str(texts.get("content_right", "")) + str(texts.get("content_main", ""))
+		"combine": lambda texts: _join_markdown(_to_markdown(texts["content_right"]), _to_markdown(texts["content_main"]))
 	},
 	"khuyennongvn.gov.vn": {
 		"selectors": {
@@ -27,38 +101,48 @@ SITE_EXTRACT_RULES = {
 			"post_summary": ("div", {"class": "postsummary"}),
 			"post_content": ("div", {"class": "noidung"})
 		},
-		"combine": lambda texts: str(texts.get("post_title", "")) + str(texts.get("post_summary", "")) + str(texts.get("post_content", ""))
+		"combine": lambda texts: _join_markdown(_heading(texts["post_title"]), _to_markdown(texts["post_summary"]), _to_markdown(texts["post_content"]))
 	},
 	"nongnghiepmoitruong.vn": {
 		"selectors": {
 			"main_title": ("h1", {"class": "main-title-super"}),
 			"content_main": ("div", {"class": "content"})
 		},
-		"combine": lambda texts: str(texts.get("main_title", "")) + str(texts.get("content_main", ""))
+		"combine": lambda texts: _join_markdown(_heading(texts["main_title"]), _to_markdown(texts["content_main"]))
 	}
 }
 
 
-def check_html_structure(soup, selectors: dict) -> bool:
-	"""Check whether the expected HTML tags exist before extraction."""
-	missing = []
-	for key, (tag, attrs) in selectors.items():
-		if not soup.find(tag, **attrs):
-			missing.append(key)
-	if missing:
-		_log.warning(f"Missing HTML tags: {', '.join(missing)}")
-		return False
-	return True
+def _build_strainer(selectors: dict) -> SoupStrainer:
+	"""Restrict parsing to the tags/classes a site's selectors look for."""
+	tags = sorted({tag for tag, _ in selectors.values()})
+	classes = frozenset(attrs["class"] for _, attrs in selectors.values())
+
+	# While parsing, the class attribute is still the raw string (e.g. "post-title big")
+	def _has_wanted_class(value) -> bool:
+		return isinstance(value, str) and not classes.isdisjoint(value.split())
+
+	return SoupStrainer(tags, class_=_has_wanted_class)
+
+
+_SITE_STRAINERS = {site: _build_strainer(rule["selectors"]) for site, rule in SITE_EXTRACT_RULES.items()}
+
+
+def _read_capped(response: requests.Response) -> Optional[bytes]:
+	"""Read a streamed response body, or None as soon as it grows past MAX_PAGE_BYTES."""
+	parts, size = [], 0
+	for part in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+		size += len(part)
+		if size > MAX_PAGE_BYTES:
+			return None
+		parts.append(part)
+	return b"".join(parts)
 
 
 def fetch_and_extract_html(url: str, session: requests.Session):
-	"""Fetch, clean, and temporarily save HTML from a URL."""
+	"""Fetch a URL and extract the relevant parts of the page as Markdown."""
 	try:
-		response = session.get(url, timeout=10)
-		response.raise_for_status()
-		soup = BeautifulSoup(response.content, 'html.parser')
-
-		# Identify URL type
+		# Identify URL type (before downloading anything)
 		url_type = next((key for key in SITE_EXTRACT_RULES if key in url), None)
 		if not url_type:
 			_log.warning(f"URL {url} is not in predefined config.")
@@ -67,74 +151,79 @@ def fetch_and_extract_html(url: str, session: requests.Session):
 		config = SITE_EXTRACT_RULES[url_type]
 		selectors = config["selectors"]
 
-		if not check_html_structure(soup, selectors):
-			_log.error(f"Invalid HTML structure for URL: {url}")
+		with session.get(url, timeout=10, stream=True) as response:
+			response.raise_for_status()
+			content = _read_capped(response)
+		if content is None:
+			_log.error(f"Page larger than {MAX_PAGE_BYTES} bytes, skipped: {url}")
 			return ""
+		soup = BeautifulSoup(content, 'lxml', parse_only=_SITE_STRAINERS[url_type])
 
-		texts = {}
-		for key, (tag, attrs) in selectors.items():
-			element = soup.find(tag, **attrs)
-			texts[key] = element if element else ""
+		# Look up every expected tag once, then validate the structure
+		texts = {key: soup.find(tag, attrs=attrs) for key, (tag, attrs) in selectors.items()}
+		missing = [key for key, element in texts.items() if element is None]
+		if missing:
+			_log.warning(f"Missing HTML tags: {', '.join(missing)}")
+			_log.error(f"Invalid HTML structure for URL: {url}")
+			return ""
 
-		html_text = config["combine"](texts)
+		markdown = config["combine"](texts)
 		_log.info(f"Processed URL: {url}")
-
-		# Save HTML snippet to a temporary file
-		with NamedTemporaryFile(mode='w', suffix='.html', delete=False, encoding='utf-8') as temp_file:
-			temp_file.write(html_text)
-			return temp_file.name
+		return markdown
 	except Exception as e:
 		_log.error(f"Error while processing {url}: {e}")
 		return None
 
 
 def read_urls_from_file(file_path: str):
-	"""Read a list of URLs from a TXT file."""
+	"""Lazily yield unique URLs from a TXT file, one per non-empty line."""
+	seen = set()
 	try:
-		with open(file_path, 'r', encoding='utf-8') as f:
-			return [line.strip() for line in f if line.strip()]
+		with open(file_path, 'r', encoding='utf-8', buffering=1 << 16) as f:
+			for line in f:
+				url = line.strip()
+				if url and url not in seen:
+					seen.add(url)
+					yield url
 	except FileNotFoundError:
 		_log.error(f"File {file_path} does not exist.")
-		return []
 	except Exception as e:
 		_log.error(f"Error while reading {file_path}: {e}")
-		return []
 
 
-def convert_html_to_markdown(file_path: str):
-	"""
-	Convert a HTML file to Markdown text using Docling.
-	"""
-	try:
-		converter = DocumentConverter()
-
-		# Run conversion
-		doc = converter.convert(file_path).document
-		markdown = doc.export_to_markdown()
-		return markdown
-
-	except Exception as e:
-		_log.error(f"Error while converting {file_path}: {e}")
-		return None
+def _make_session() -> requests.Session:
+	"""Session with a keep-alive pool sized for the fetch threads, retries and compression."""
+	session = requests.Session()
+	adapter = HTTPAdapter(pool_connections=FETCH_WORKERS, pool_maxsize=FETCH_WORKERS, max_retries=FETCH_RETRY)
+	session.mount("http://", adapter)
+	session.mount("https://", adapter)
+	# gzip/deflate, plus br/zstd when the decoders are installed
+	session.headers.update(make_headers(accept_encoding=True))
+	session.headers["User-Agent"] = USER_AGENT
+	return session
 
 
 def ingest_urls(urls_file: str) -> None:
 	urls = read_urls_from_file(urls_file)
-	if not urls:
-		logging.info("No URLs to ingest.")
-		return
-	with requests.Session() as session:
-		for url in urls:
-			temp_file_path = fetch_and_extract_html(url, session)
-			if not temp_file_path:
-				logging.error(f"Failed to extract content from {url}")
-				continue
-			markdown = convert_html_to_markdown(temp_file_path)
-			if not markdown:
-				logging.error(f"Failed to convert HTML to markdown for {url}")
-				os.unlink(temp_file_path)
-				continue
-			clean_markdown = normalize_markdown_urls(markdown)
-			chunks = chunk_markdown(clean_markdown, max_tokens=500, overlap=100, min_tokens=200)
-			add_chunks_to_vectorstore(chunks)
-			os.unlink(temp_file_path)
+	with _make_session() as session, ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor, ChunkWriter() as writer:
+		# Fetch and extract in the thread pool, keeping at most MAX_IN_FLIGHT URLs
+		# submitted, and handle pages in completion order so one slow URL doesn't
+		# hold back the others. Chroma writes stay on this thread.
+		pending = {executor.submit(fetch_and_extract_html, url, session): url for url in islice(urls, MAX_IN_FLIGHT)}
+		if not pending:
+			logging.info("No URLs to ingest.")
+		while pending:
+			done, _ = wait(pending, return_when=FIRST_COMPLETED)
+			for future in done:
+				# pop so finished pages are not kept alive until the end
+				url = pending.pop(future)
+				next_url = next(urls, None)
+				if next_url is not None:
+					pending[executor.submit(fetch_and_extract_html, next_url, session)] = next_url
+				markdown = future.result()
+				if not markdown:
+					logging.error(f"Failed to extract content from {url}")
+					continue
+				clean_markdown = normalize_markdown_urls(markdown)
+				chunks = chunk_markdown(clean_markdown, max_tokens=500, overlap=100, min_tokens=200)
+				writer.add(chunks)
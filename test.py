@@ -1,11 +1,8 @@
-import chromadb
-
-from config import CHROMA_DIR, CHROMA_COLLECTION
+from vectorstore.chroma_store import get_collection
 from vectorstore.embeddings import get_embedding
 
 
-client = chromadb.PersistentClient(path=CHROMA_DIR)
-col = client.get_or_create_collection(CHROMA_COLLECTION)
+col = get_collection()
 
 print("Documents count:", col.count())
 
@@ -2,7 +2,7 @@ import re
 import unicodedata
 
 # Tập các ký tự tiếng Việt có dấu (hoa + thường) và chữ Đ/đ
-VIE_DIACRITICS = set(
+VIE_DIACRITICS = frozenset(
 	"ÀÁẢÃẠÂẦẤẨẪẬĂẰẮẲẴẶ"
 	"ÈÉẺẼẸÊỀẾỂỄỆ"
 	"ÌÍỈĨỊ"
@@ -19,18 +19,32 @@ VIE_DIACRITICS = set(
 	"đ"
 )
 
-def _is_vietnamese_header(line: str) -> bool:
-	"""Trả True nếu line bắt đầu bằng '##' và chứa ít nhất một ký tự tiếng Việt có dấu."""
-	if not line.strip().startswith("##"):
-		return False
-	return any(ch in VIE_DIACRITICS for ch in line)
-
-def _find_tomtat_index(lines):
-	"""Tìm index của dòng header '## TÓM TẮT' (match khá chặt: chữ TÓM và TẮT có dấu)."""
-	for i, line in enumerate(lines):
-		if re.match(r'^\s*##\s*TÓM\s+TẮT\b', line.strip(), flags=re.UNICODE):
-			return i
-	return None
+# Dòng header '##' đầu tiên có chứa ký tự tiếng Việt có dấu (quét cả văn bản một lần)
+_VIE_HEADER_RE = re.compile(
+	r"^[^\S\n]*##[^\n]*?[" + re.escape("".join(sorted(VIE_DIACRITICS))) + "]",
+	re.MULTILINE
+)
+# Dòng header '## TÓM TẮT' (match khá chặt: chữ TÓM và TẮT có dấu)
+_TOMTAT_RE = re.compile(r'^[^\S\n]*##[^\S\n]*TÓM[^\S\n]+TẮT\b', re.MULTILINE)
+# remove_noise: dòng bắt đầu bằng "Hình <số>." | comment <!-- ... --> (có thể nhiều dòng)
+_NOISE_RE = re.compile(r"^Hình\s*\d+\.[^\n]*$|<!--[\s\S]*?-->", re.MULTILINE)
+_BLANK_LINES_RE = re.compile(r"\n\s*\n")
+_OCR_FOOTNOTE_RE = re.compile(r"^\s*\d+\s+[A-ZÀ-Ỹ].*$", re.MULTILINE)
+# Bắt cả cụm '/uniXXXX' + optional chữ cái đi kèm ngay sau
+_UNI_ESCAPE_RE = re.compile(r'/uni([0-9A-Fa-f]{4})([a-zA-Z])?')
+# Dòng header '##' (remove_tail_sections chỉ xét các dòng này)
+_H2_LINE_RE = re.compile(r"^##[^\n]*", re.MULTILINE)
+# Tên section cuối (viết hoa, đã bỏ khoảng trắng) -> chịu được 'L ỜI C ẢM Ơ N' do OCR
+_ACK_KEY = "LỜICẢMƠN"
+_REF_KEY = "TÀILIỆUTHAMKHẢO"
+
+def _line_end(text: str, pos: int) -> int:
+	"""Vị trí ký tự xuống dòng kết thúc dòng chứa pos (hoặc len(text))."""
+	end = text.find("\n", pos)
+	return len(text) if end == -1 else end
+
+def _rstrip_lines(text: str) -> str:
+	return "\n".join(l.rstrip() for l in text.splitlines())
 
 def keep_vietnamese_header_and_tomtat(text: str) -> str:
 	"""
@@ -39,43 +53,32 @@ def keep_vietnamese_header_and_tomtat(text: str) -> str:
 	- Nếu không tìm thấy header tiếng Việt nhưng có '## TÓM TẮT', thì giữ từ '## TÓM TẮT' trở đi.
 	- Nếu không tìm thấy gì phù hợp thì trả về nguyên văn (strip).
 	"""
-	lines = text.splitlines()
-
-	# tìm header tiếng Việt đầu tiên
-	start_idx = None
-	for i, line in enumerate(lines):
-		if _is_vietnamese_header(line):
-			start_idx = i
-			break
-
-	tom_idx = _find_tomtat_index(lines)
-
-	# fallback: nếu không có header tiếng Việt nhưng có ## TÓM TẮT -> bắt đầu từ tom_idx
-	if start_idx is None:
-		if tom_idx is not None:
-			return "\n".join(l.rstrip() for l in lines[tom_idx:]).strip()
+	# tìm header tiếng Việt đầu tiên và header ## TÓM TẮT (vị trí đầu dòng trong text)
+	header = _VIE_HEADER_RE.search(text)
+	tom = _TOMTAT_RE.search(text)
+
+	# fallback: nếu không có header tiếng Việt nhưng có ## TÓM TẮT -> bắt đầu từ tom
+	if header is None:
+		if tom is not None:
+			return _rstrip_lines(text[tom.start():]).strip()
 		else:
 			return text.strip()
 
-	# nếu không có ## TÓM TẮT hoặc tom trước start (kỳ lạ) => giữ từ start_idx
-	if tom_idx is None or tom_idx < start_idx:
-		return "\n".join(l.rstrip() for l in lines[start_idx:]).strip()
+	# nếu không có ## TÓM TẮT hoặc tom trước header (kỳ lạ) => giữ từ header
+	if tom is None or tom.start() < header.start():
+		return _rstrip_lines(text[header.start():]).strip()
 
-	# trường hợp bình thường: start_idx <= tom_idx
-	# giữ header start, một dòng trống, header TÓM TẮT, rồi phần còn lại (sau tom_idx)
-	result = []
-	result.append(lines[start_idx].strip())
-	if tom_idx != start_idx:
+	# trường hợp bình thường: header <= tom
+	# giữ header, một dòng trống, header TÓM TẮT, rồi phần còn lại (sau tom)
+	rest_start = _line_end(text, header.start())
+	result = [text[header.start():rest_start].strip()]
+	if tom.start() != header.start():
 		result.append("")  # bắt buộc 1 dòng trống giữa 2 header
-		result.append(lines[tom_idx].strip())
-		# thêm phần sau '## TÓM TẮT' (giữ nguyên spacing trên các dòng phía sau)
-		if tom_idx + 1 < len(lines):
-			rest = [l.rstrip() for l in lines[tom_idx+1:]]
-			# nếu phần sau bắt đầu bằng dòng rỗng, giữ nguyên (không ép)
-			result.extend(rest)
-	else:
-		# trường hợp header tìm thấy chính là '## TÓM TẮT'
-		result.extend([l.rstrip() for l in lines[start_idx+1:]])
+		rest_start = _line_end(text, tom.start())
+		result.append(text[tom.start():rest_start].strip())
+	# thêm phần còn lại (giữ nguyên spacing đầu dòng, chỉ bỏ khoảng trắng cuối dòng)
+	if rest_start < len(text):
+		result.append(_rstrip_lines(text[rest_start + 1:]))
 
 	return "\n".join(result).rstrip()
 
@@ -86,8 +89,9 @@ def normalize_unicode_artifacts(text: str) -> str:
 	Nếu có ký tự ngay sau '/uniXXXX' (ví dụ 'kh/uni1ECFe'),
 	thì bỏ ký tự đó và chỉ giữ lại ký tự Unicode đúng.
 	"""
-	# Bắt cả cụm '/uniXXXX' + optional chữ cái đi kèm ngay sau
-	pattern = re.compile(r'/uni([0-9A-Fa-f]{4})([a-zA-Z])?')
+	# Phần lớn văn bản không chứa '/uni' -> bỏ qua regex
+	if '/uni' not in text:
+		return unicodedata.normalize("NFC", text).strip()
 
 	def _repl(m):
 		code_hex = m.group(1)
@@ -97,7 +101,7 @@ def normalize_unicode_artifacts(text: str) -> str:
 		except Exception:
 			return m.group(0)
 
-	text = pattern.sub(_repl, text)
+	text = _UNI_ESCAPE_RE.sub(_repl, text)
 
 	# Normalize NFC để tổ hợp dấu đầy đủ
 	text = unicodedata.normalize("NFC", text)
@@ -110,25 +114,18 @@ def remove_tail_sections(text: str) -> str:
 	Loại bỏ phần từ '## LỜI CẢM ƠN' nếu có.
 	Nếu không có thì fallback sang '## TÀI LIỆU THAM KHẢO'.
 	"""
-	# Regex cho các header
-	ack_pattern = re.compile(
-		r"^##\s*L\s*Ờ\s*I\s*C\s*Ả\s*M\s*Ơ\s*N.*",
-		re.IGNORECASE | re.MULTILINE
-	)
-	ref_pattern = re.compile(
-		r"^##\s*T\s*À\s*I\s*L\s*I\s*Ệ\s*U\s*T\s*H\s*A\s*M\s*K\s*H\s*Ả\s*O.*",
-		re.IGNORECASE | re.MULTILINE
-	)
-
-	# Ưu tiên tìm 'LỜI CẢM ƠN'
-	match_ack = ack_pattern.search(text)
-	if match_ack:
-		return text[:match_ack.start()].rstrip()
-
-	# Nếu không có thì fallback sang 'TÀI LIỆU THAM KHẢO'
-	match_ref = ref_pattern.search(text)
-	if match_ref:
-		return text[:match_ref.start()].rstrip()
+	# Duyệt các header '##' một lần: bỏ khoảng trắng, viết hoa rồi so tiền tố.
+	# Ưu tiên 'LỜI CẢM ƠN', nhớ vị trí 'TÀI LIỆU THAM KHẢO' đầu tiên để fallback.
+	ref_start = None
+	for m in _H2_LINE_RE.finditer(text):
+		key = "".join(m.group()[2:].split()).upper()
+		if key.startswith(_ACK_KEY):
+			return text[:m.start()].rstrip()
+		if ref_start is None and key.startswith(_REF_KEY):
+			ref_start = m.start()
+
+	if ref_start is not None:
+		return text[:ref_start].rstrip()
 
 	# Nếu không tìm thấy gì thì trả về nguyên văn
 	return text
@@ -139,20 +136,17 @@ def remove_noise(text: str) -> str:
 	- Dòng bắt đầu bằng 'Hình X.'
 	- Các block <!-- ... -->
 	"""
-	# Xóa dòng bắt đầu bằng "Hình <số>."
-	text = re.sub(r"^Hình\s*\d+\..*$", "", text, flags=re.MULTILINE)
-
-	# Xóa toàn bộ comment <!-- ... -->
-	text = re.sub(r"<!--.*?-->", "", text, flags=re.DOTALL)
+	# Xóa dòng "Hình <số>." và comment <!-- ... --> trong cùng một lượt quét
+	text = _NOISE_RE.sub("", text)
 
 	# Xóa dòng trống thừa sau khi loại bỏ
-	text = re.sub(r"\n\s*\n", "\n\n", text)
+	text = _BLANK_LINES_RE.sub("\n\n", text)
 
 	return text.strip()
 
 
 def remove_ocr_footnotes(text: str) -> str:
-	return re.sub(r"^\s*\d+\s+[A-ZÀ-Ỹ].*$", "", text, flags=re.MULTILINE)
+	return _OCR_FOOTNOTE_RE.sub("", text)
 
 
 def normalize_markdown_pdfs(text: str) -> str:
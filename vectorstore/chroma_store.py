@@ -1,27 +1,119 @@
-from typing import List, Dict, Any
+import hashlib
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List
 import chromadb
+from chromadb.config import Settings
+from chunking.chunking import ChunkBatch
 from config import CHROMA_DIR, CHROMA_COLLECTION
-from .embeddings import get_embeddings
+from .embedding_cache import get_cached_embeddings
 
-_client = chromadb.PersistentClient(path=CHROMA_DIR)
-_collection = _client.get_or_create_collection(name=CHROMA_COLLECTION)
+_log = logging.getLogger(__name__)
+
+# Max chunks per embedding request / collection.add call; keeps request payloads
+# and peak memory bounded and stays under Chroma's max batch size.
+ADD_BATCH_SIZE = 512
+# Chunks buffered across documents by ChunkWriter before a flush
+FLUSH_SIZE = 1024
+
+
+@lru_cache(maxsize=1)
+def get_collection():
+	"""
+	Open the persistent Chroma client on first use and return the collection.
+	Shared by everything in the process, so the index is only loaded once.
+	"""
+	client = chromadb.PersistentClient(path=CHROMA_DIR, settings=Settings(anonymized_telemetry=False))
+	return client.get_or_create_collection(name=CHROMA_COLLECTION)
+
+
+def _make_id(doc_title: str, chunk_id: int, content: str) -> str:
+	"""
+	Stable record id for a chunk. chunk_id alone restarts at 1 for every document,
+	so it is hashed together with the title and content; re-ingesting the same
+	document yields the same ids.
+	"""
+	key = f"{doc_title}\0{chunk_id}\0{content}".encode("utf-8")
+	return hashlib.blake2b(key, digest_size=16).hexdigest()
+
+
+def _write(texts: List[str], ids: List[str], metadatas: List[Dict[str, Any]]) -> int:
+	"""
+	Embed and add chunks in ADD_BATCH_SIZE windows. A failed window is logged
+	(with its document titles, for re-ingestion) and skipped; the others are
+	still written. Returns the number of chunks that were not saved.
+	"""
+	collection = get_collection()
+	failed = 0
+	for start in range(0, len(texts), ADD_BATCH_SIZE):
+		end = start + ADD_BATCH_SIZE
+		batch_texts = texts[start:end]
+		try:
+			embs = get_cached_embeddings(batch_texts)
+			if not embs or len(embs) != len(batch_texts):
+				raise ValueError("failed to compute embeddings for some or all chunks")
+			collection.add(documents=batch_texts, embeddings=embs, metadatas=metadatas[start:end], ids=ids[start:end])
+		except Exception as e:
+			failed += len(batch_texts)
+			titles = sorted({metadata.get("doc_title", "") for metadata in metadatas[start:end]})
+			_log.error(f"Skipped {len(batch_texts)} chunks ({e}); re-ingest documents: {titles}")
+	print(f"Saved {len(texts) - failed} chunks to ChromaDB collection '{CHROMA_COLLECTION}'.")
+	return failed
 
-def add_chunks_to_vectorstore(chunks: List[Dict[str, Any]]) -> None:
-	if not chunks:
-		return
-	texts = [ch["content"] for ch in chunks]
-	ids = [str(ch["chunk_id"]) for ch in chunks]
-	metadatas = [{
-		"doc_title": ch.get("doc_title"),
-		"section": ch.get("section"),
-		"chunk_id": ch.get("chunk_id"),
-	} for ch in chunks]
-
-	embs = get_embeddings(texts)
-	if not embs or len(embs) != len(texts):
-		print("Failed to compute embeddings for some or all chunks; aborting save.")
-		return
 
-	_collection.add(documents=texts, embeddings=embs, metadatas=metadatas, ids=ids)
-	print(f"Saved {len(chunks)} chunks to ChromaDB collection '{CHROMA_COLLECTION}'.")
+class ChunkWriter:
+	"""
+	Buffer chunks from several documents and write them to the collection in
+	large batches (flushed every FLUSH_SIZE chunks and on exit).
 
+	with ChunkWriter() as writer:
+		for chunks in ...:
+			writer.add(chunks)
+	"""
+
+	def __init__(self, flush_size: int = FLUSH_SIZE) -> None:
+		self.flush_size = flush_size
+		self._texts: List[str] = []
+		self._ids: List[str] = []
+		self._metadatas: List[Dict[str, Any]] = []
+		self._pending_ids = set()
+
+	def add(self, chunks: ChunkBatch) -> None:
+		for section, chunk_id, content in zip(chunks.sections, chunks.chunk_ids, chunks.contents):
+			record_id = _make_id(chunks.doc_title, chunk_id, content)
+			if record_id in self._pending_ids:
+				# Chroma rejects duplicate ids within one add call
+				continue
+			self._pending_ids.add(record_id)
+			self._texts.append(content)
+			self._ids.append(record_id)
+			# Chroma rejects None metadata values, so missing fields are left out
+			self._metadatas.append({
+				key: value
+				for key, value in (("doc_title", chunks.doc_title), ("section", section), ("chunk_id", chunk_id))
+				if value is not None
+			})
+		if len(self._texts) >= self.flush_size:
+			self.flush()
+
+	def flush(self) -> int:
+		"""Write the buffered chunks; returns how many of them failed to save."""
+		if not self._texts:
+			return 0
+		failed = _write(self._texts, self._ids, self._metadatas)
+		self._texts, self._ids, self._metadatas = [], [], []
+		self._pending_ids = set()
+		return failed
+
+	def __enter__(self) -> "ChunkWriter":
+		return self
+
+	def __exit__(self, *exc_info) -> None:
+		self.flush()
+
+
+def add_chunks_to_vectorstore(chunks: ChunkBatch) -> None:
+	if not chunks:
+		return
+	with ChunkWriter() as writer:
+		writer.add(chunks)
@@ -0,0 +1,72 @@
+import hashlib
+import os
+import sqlite3
+from array import array
+from typing import Dict, List
+
+from config import CHROMA_DIR, EMBEDDING_MODEL
+from .embeddings import get_embeddings
+
+# SQLite file (next to the Chroma data) mapping content hash -> float32 embedding
+CACHE_PATH = os.path.join(CHROMA_DIR, "embedding_cache.sqlite3")
+# Keys per SELECT ... IN (...), below SQLite's bound-parameter limit
+_LOOKUP_BATCH_SIZE = 500
+
+_conn = None
+
+
+def _get_conn() -> sqlite3.Connection:
+	global _conn
+	if _conn is None:
+		os.makedirs(CHROMA_DIR, exist_ok=True)
+		_conn = sqlite3.connect(CACHE_PATH)
+		_conn.execute("CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, embedding BLOB NOT NULL)")
+	return _conn
+
+
+def content_hash(text: str) -> str:
+	"""Cache key for a text; includes the model name so switching models never reuses vectors."""
+	return hashlib.blake2b(f"{EMBEDDING_MODEL}\0{text}".encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _lookup(keys: List[str]) -> Dict[str, List[float]]:
+	conn = _get_conn()
+	found = {}
+	for start in range(0, len(keys), _LOOKUP_BATCH_SIZE):
+		batch = keys[start:start + _LOOKUP_BATCH_SIZE]
+		placeholders = ",".join("?" * len(batch))
+		rows = conn.execute(f"SELECT hash, embedding FROM embeddings WHERE hash IN ({placeholders})", batch)
+		for key, blob in rows:
+			found[key] = array("f", blob).tolist()
+	return found
+
+
+def get_cached_embeddings(texts: List[str]) -> List[List[float]]:
+	"""
+	Return embeddings for a batch of texts, only calling the embedding API for
+	texts not already in the on-disk cache. Empty list on failure.
+	"""
+	try:
+		keys = [content_hash(t) for t in texts]
+		found = _lookup(list(set(keys)))
+
+		misses = {}
+		for key, text in zip(keys, texts):
+			if key not in found:
+				misses.setdefault(key, text)
+		if misses:
+			embs = get_embeddings(list(misses.values()))
+			if not embs or len(embs) != len(misses):
+				return []
+			conn = _get_conn()
+			with conn:
+				conn.executemany(
+					"INSERT OR REPLACE INTO embeddings (hash, embedding) VALUES (?, ?)",
+					[(key, array("f", emb).tobytes()) for key, emb in zip(misses, embs)],
+				)
+			found.update(zip(misses, embs))
+
+		return [found[key] for key in keys]
+	except sqlite3.Error as exc:
+		print(f"Embedding cache failed: {exc}")
+		return get_embeddings(texts)
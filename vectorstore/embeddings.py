@@ -1,7 +1,13 @@
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 from langchain_openai import OpenAIEmbeddings
+from chunking.chunking import ChunkBatch
 from config import OPENAI_API_KEY, OPENAI_API_BASE, EMBEDDING_MODEL
 
+# Texts per embedding request, and how many requests may be in flight at once
+EMBED_BATCH_SIZE = 96
+EMBED_WORKERS = 4
+
 # Initialize embedding client (idempotent)
 embedding_client = OpenAIEmbeddings(
 	model=EMBEDDING_MODEL,
@@ -23,14 +29,28 @@ def get_embedding(text: str) -> Optional[List[float]]:
 def get_embeddings(texts: List[str]) -> List[List[float]]:
 	"""
 	Return embeddings for a batch of texts. Empty list on failure.
+	Duplicate texts are embedded once, and distinct texts are sent longest-first so
+	each server-side batch holds similar lengths (less padding). Requests of
+	EMBED_BATCH_SIZE texts run concurrently; results are returned in the original order.
 	"""
 	try:
-		return embedding_client.embed_documents(texts)
+		unique_texts = sorted(dict.fromkeys(texts), key=len, reverse=True)
+		windows = [unique_texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(unique_texts), EMBED_BATCH_SIZE)]
+		if len(windows) <= 1:
+			unique_embs = embedding_client.embed_documents(unique_texts)
+		else:
+			with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as executor:
+				window_embs = executor.map(embedding_client.embed_documents, windows)
+				unique_embs = [emb for embs in window_embs for emb in embs]
+		if len(unique_embs) != len(unique_texts):
+			return []
+		emb_by_text = dict(zip(unique_texts, unique_embs))
+		return [emb_by_text[t] for t in texts]
 	except Exception as exc:
 		print(f"Batch embedding failed: {exc}")
 		return []
 
-def add_chunks_to_collection(chunks: List[Dict[str, Any]]) -> None:
+def add_chunks_to_collection(chunks: ChunkBatch) -> None:
 	"""
 	Deprecated. Use vectorstore/chroma_store.add_chunks_to_vectorstore instead.
 	"""